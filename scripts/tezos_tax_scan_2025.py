@@ -24,6 +24,7 @@ Outputs (in ./out):
 - irs_2025_disposals_fifo.csv
 - hmrc_2025_disposals_pooling.csv
 - summary_2025.json
+- price_cache.json (daily XTZ prices, reused on later runs)
 
 DISCLAIMER: This is a classification + calculation helper, not tax advice.
 """
@@ -35,13 +36,35 @@ import json
 import math
 import os
 import sys
+import threading
 import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, asdict
-from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+import urllib.error
 import urllib.request
 import urllib.parse
 
+try:  # optional: much faster JSON encoding for the breakdown columns
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # optional: pooled keep-alive connections + gzip; urllib is the fallback
+    import requests
+except ImportError:
+    requests = None
+
+try:  # optional: incremental parsing of TzKT pages
+    import ijson
+except ImportError:
+    ijson = None
+
+T = TypeVar("T")
+
 
 # -----------------------------
 # Config
@@ -54,18 +77,125 @@ YEAR = 2025
 START_ISO = f"{YEAR}-01-01T00:00:00Z"
 END_ISO   = f"{YEAR+1}-01-01T00:00:00Z"
 
+TZKT_WORKERS = 8  # concurrent page fetches per TzKT listing
+
 OUT_DIR = "out"
+PRICE_CACHE_PATH = os.path.join(OUT_DIR, "price_cache.json")
+
+# CSV schemas; the classifiers yield tuples in exactly this column order
+IRS_FIELDS = [
+    "timestamp","level","op_hash","kind","direction","counterparty","asset","quantity","fee_xtz","tags","confidence","irs_category","irs_taxable","xtz_fmv_usd_daily"
+]
+FIFO_FIELDS = [
+    "timestamp","asset","qty_disposed","fmv_usd_per_xtz_used","proceeds_usd_est","basis_usd_fifo_est","gain_usd_est","fee_xtz","op_hash","lot_breakdown_json","note"
+]
+HMRC_FIELDS = [
+    "timestamp","asset","qty_disposed","fmv_gbp_per_xtz_used","proceeds_gbp_est","allowable_cost_gbp_est","gain_gbp_est","op_hash","matching_breakdown_json","note"
+]
 
 
 # -----------------------------
 # Helpers
 # -----------------------------
 
+class RateLimiter:
+    """
+    Sliding-window limiter: at most max_calls per period seconds. Only sleeps
+    when the window is full. Thread-safe (TzKT pages are fetched concurrently).
+    """
+    def __init__(self, max_calls: int, period: float):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return
+                wait = self.period - (now - self._calls[0])
+            time.sleep(wait)
+
+
+# Per-host budgets, a little under the public API limits
+RATE_LIMITERS = {
+    "api.tzkt.io": RateLimiter(10, 1.0),
+    "api.coingecko.com": RateLimiter(30, 60.0),
+}
+HTTP_MAX_RETRIES = 5  # on HTTP 429
+
+HTTP_HEADERS = {"User-Agent": "tezos-tax-scanner/1.0"}
+
+# One shared session so TzKT/CoinGecko calls reuse TLS connections
+# (the default pool of 10 per host covers TZKT_WORKERS).
+SESSION = None
+if requests is not None:
+    SESSION = requests.Session()
+    SESSION.headers.update({**HTTP_HEADERS, "Accept-Encoding": "gzip"})
+
+def retry_delay(retry_after: Optional[str], attempt: int) -> float:
+    # honour a numeric Retry-After, otherwise back off exponentially
+    try:
+        return max(0.0, float(retry_after))  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return float(2 ** attempt)
+
+def http_open(url: str, timeout: int = 30, stream: bool = False) -> Any:
+    """
+    GET url with per-host rate limiting and HTTP 429 retries. Returns the open
+    response (requests.Response or urllib response); the caller closes it.
+    """
+    limiter = RATE_LIMITERS.get(urllib.parse.urlsplit(url).hostname or "")
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        if SESSION is not None:
+            r = SESSION.get(url, timeout=timeout, stream=stream)
+            if r.status_code != 429 or attempt >= HTTP_MAX_RETRIES:
+                r.raise_for_status()
+                return r
+            retry_after = r.headers.get("Retry-After")
+            r.close()
+        else:
+            req = urllib.request.Request(url, headers=HTTP_HEADERS)
+            try:
+                return urllib.request.urlopen(req, timeout=timeout)
+            except urllib.error.HTTPError as exc:
+                if exc.code != 429 or attempt >= HTTP_MAX_RETRIES:
+                    raise
+                retry_after = exc.headers.get("Retry-After")
+        time.sleep(retry_delay(retry_after, attempt))
+        attempt += 1
+
 def http_get_json(url: str, timeout: int = 30) -> Any:
-    req = urllib.request.Request(url, headers={"User-Agent": "tezos-tax-scanner/1.0"})
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        body = resp.read()
-    return json.loads(body.decode("utf-8"))
+    resp = http_open(url, timeout)
+    with resp:
+        if SESSION is not None:
+            return resp.json()
+        return json.loads(resp.read().decode("utf-8"))
+
+def http_get_json_stream(url: str, timeout: int = 30) -> Iterator[Any]:
+    # Yield the items of a top-level JSON array one at a time. With ijson the
+    # body is parsed incrementally; without it we fall back to a full parse.
+    if ijson is None:
+        data = http_get_json(url, timeout)
+        if isinstance(data, list):
+            yield from data
+        return
+    resp = http_open(url, timeout, stream=True)
+    with resp:
+        if SESSION is not None:
+            resp.raw.decode_content = True  # let urllib3 undo gzip
+            body = resp.raw
+        else:
+            body = resp
+        yield from ijson.items(body, "item", use_float=True)
 
 def iso_to_dt(s: str) -> datetime:
     # TzKT uses ISO strings like "2025-03-01T12:34:56Z"
@@ -79,12 +209,30 @@ def dt_to_iso_z(dt: datetime) -> str:
 def ensure_out_dir() -> None:
     os.makedirs(OUT_DIR, exist_ok=True)
 
-def write_csv(path: str, rows: List[Dict[str, Any]], fieldnames: List[str]) -> None:
+def write_csv(path: str, header: List[str], rows: Iterable[Tuple[Any, ...]]) -> int:
+    # rows are tuples in header order and may be a generator; they are
+    # written as produced. Returns row count.
+    n = 0
     with open(path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
+        w = csv.writer(f, dialect="unix", quoting=csv.QUOTE_MINIMAL)
+        w.writerow(header)
         for r in rows:
-            w.writerow({k: r.get(k, "") for k in fieldnames})
+            w.writerow(r)
+            n += 1
+    return n
+
+def dumps_json(obj: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False)
+
+def write_json(path: str, obj: Any) -> None:
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2)
 
 def clamp(n: float) -> float:
     if math.isfinite(n):
@@ -97,9 +245,6 @@ def safe_float(x: Any) -> float:
     except Exception:
         return 0.0
 
-def sleep_polite():
-    time.sleep(0.15)
-
 
 # -----------------------------
 # Pricing
@@ -109,10 +254,39 @@ class PriceOracle:
     """
     Best effort oracle using CoinGecko for XTZ->USD/GBP (daily).
     If you want exact timestamp pricing, swap this for your own source.
+
+    Prices are persisted to PRICE_CACHE_PATH (shared by all currencies, keyed
+    "<vs>:YYYY-MM-DD") so re-runs don't re-query CoinGecko for known dates.
     """
-    def __init__(self, vs_currency: str):
+    def __init__(self, vs_currency: str, cache_path: str = PRICE_CACHE_PATH):
         self.vs = vs_currency.lower()
+        self._path = cache_path
         self.cache: Dict[str, float] = {}  # key: YYYY-MM-DD -> price
+        prefix = f"{self.vs}:"
+        for key, price in self._load_disk_cache().items():
+            if key.startswith(prefix):
+                self.cache[key[len(prefix):]] = safe_float(price)
+
+    def _load_disk_cache(self) -> Dict[str, Any]:
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _save_disk_cache(self, prices: Dict[str, float]) -> None:
+        # Re-read before writing so oracles for other currencies sharing the
+        # file don't clobber each other's entries.
+        data = self._load_disk_cache()
+        data.update({f"{self.vs}:{d}": p for d, p in prices.items()})
+        tmp = self._path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, sort_keys=True)
+            os.replace(tmp, self._path)
+        except OSError:
+            pass  # cache is an optimisation only
 
     def xtz_price_on_date(self, date_yyyy_mm_dd: str) -> float:
         if date_yyyy_mm_dd in self.cache:
@@ -123,7 +297,6 @@ class PriceOracle:
         qdate = f"{dd}-{mm}-{yyyy}"
         url = f"{COINGECKO_BASE}/coins/tezos/history?{urllib.parse.urlencode({'date': qdate, 'localization': 'false'})}"
         data = http_get_json(url)
-        sleep_polite()
 
         price = 0.0
         try:
@@ -131,18 +304,96 @@ class PriceOracle:
         except Exception:
             price = 0.0
         self.cache[date_yyyy_mm_dd] = price
+        if price > 0:
+            # don't persist misses; CoinGecko may just not have the day yet
+            self._save_disk_cache({date_yyyy_mm_dd: price})
         return price
 
+    def prefetch_range(self, start_dt: datetime, end_dt: datetime) -> int:
+        """
+        Fill the cache for [start_dt, end_dt) with one market_chart/range call
+        instead of one /history call per day. Returns number of days added.
+        Days this misses are still picked up lazily by xtz_price_on_date.
+        """
+        end_dt = min(end_dt, datetime.now(timezone.utc))
+        day = start_dt
+        while day < end_dt and day.strftime("%Y-%m-%d") in self.cache:
+            day += timedelta(days=1)
+        if day >= end_dt:
+            return 0  # already fully cached
+
+        params = {
+            "vs_currency": self.vs,
+            "from": int(start_dt.timestamp()),
+            "to": int(end_dt.timestamp()),
+        }
+        url = f"{COINGECKO_BASE}/coins/tezos/market_chart/range?{urllib.parse.urlencode(params)}"
+        try:
+            data = http_get_json(url)
+            points = data["prices"]
+        except Exception:
+            return 0
+
+        added: Dict[str, float] = {}
+        for ts_ms, price in points:
+            d = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+            # daily points are 00:00 UTC snapshots; keep the first one per day
+            # (same convention as /history) and never override known prices
+            if d in self.cache or d in added:
+                continue
+            p = safe_float(price)
+            if p > 0:
+                added[d] = p
+        self.cache.update(added)
+        if added:
+            self._save_disk_cache(added)
+        return len(added)
+
+    def price_for_day(self, day: str) -> float:
+        # hot path: callers pass Event.day, so a cache hit costs one dict lookup
+        price = self.cache.get(day)
+        if price is not None:
+            return price
+        return self.xtz_price_on_date(day)
+
     def xtz_fmv(self, dt: datetime) -> float:
         d = dt.strftime("%Y-%m-%d")
-        return self.xtz_price_on_date(d)
+        return self.price_for_day(d)
 
 
 # -----------------------------
 # Data model
 # -----------------------------
 
-@dataclass
+class XtzOp(NamedTuple):
+    """The fields of a TzKT transaction that build_events needs."""
+    timestamp: str
+    level: int
+    op_hash: str
+    sender: str
+    target: str
+    amount_mutez: float
+    fee_mutez: float
+    has_parameter: bool
+
+
+class TokenTransferOp(NamedTuple):
+    """The fields of a TzKT token transfer that build_events needs."""
+    timestamp: str
+    level: int
+    op_hash: str
+    from_address: str
+    to_address: str
+    contract: str
+    token_id: Any
+    standard: str
+    symbol: Optional[str]
+    name: Optional[str]
+    decimals: Any                 # as reported in token metadata (often a string)
+    raw_amount: float
+
+
+@dataclass(slots=True)
 class Event:
     timestamp: str                # ISO Z
     level: int
@@ -156,28 +407,110 @@ class Event:
     note: str
     tags: str                     # pipe-separated
     confidence: str               # "high"|"medium"|"low"
+    dt: datetime                  # parsed timestamp (parsed once in build_events)
+    day: str                      # UTC date "YYYY-MM-DD"
+
+
+@dataclass(slots=True)
+class Acq:
+    """An XTZ acquisition available for HMRC matching; qty is drained in place."""
+    ts: str
+    dt: datetime
+    qty: float
+    cost_per: float               # GBP per XTZ
 
 
 # -----------------------------
 # TzKT fetchers (2025 only)
 # -----------------------------
 
-def tzkt_paginated(url: str, limit: int = 1000) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
+def tzkt_count(path: str, params: Dict[str, Any]) -> Optional[int]:
+    # TzKT exposes /<collection>/count with the same filters (sorting is irrelevant)
+    count_params = {k: v for k, v in params.items() if not k.startswith("sort.")}
+    try:
+        n = http_get_json(f"{TZKT_BASE}{path}/count?{urllib.parse.urlencode(count_params)}")
+        return int(n)
+    except Exception:
+        return None
+
+def tzkt_paginated(path: str, params: Dict[str, Any], project: Callable[[Dict[str, Any]], Optional[T]], limit: int = 1000) -> Iterator[T]:
+    # Each page is stream-parsed and projected into compact records as it
+    # arrives, so raw TzKT dicts never outlive their item. project() returns
+    # None to skip an item. Records are yielded in page order.
+    def fetch_page(offset: int) -> Tuple[int, List[T]]:
+        page_url = f"{TZKT_BASE}{path}?" + urllib.parse.urlencode({**params, "limit": limit, "offset": offset})
+        n = 0
+        rows: List[T] = []
+        for item in http_get_json_stream(page_url):
+            n += 1
+            r = project(item)
+            if r is not None:
+                rows.append(r)
+        return n, rows
+
     offset = 0
+
+    # Pages are independent offset windows, so fetch them concurrently when
+    # the total is known up front (I/O bound; threads are fine here). Work in
+    # batches of TZKT_WORKERS pages so only one batch is held at a time.
+    total = tzkt_count(path, params)
+    if total:
+        offsets = list(range(0, total, limit))
+        n = 0
+        with ThreadPoolExecutor(max_workers=TZKT_WORKERS) as pool:
+            for i in range(0, len(offsets), TZKT_WORKERS):
+                for n, rows in pool.map(fetch_page, offsets[i:i + TZKT_WORKERS]):
+                    yield from rows
+        if n < limit:
+            return
+        offset = offsets[-1] + limit  # more ops than counted; continue below
+    elif total == 0:
+        return
+
     while True:
-        page_url = url + ("&" if "?" in url else "?") + urllib.parse.urlencode({"limit": limit, "offset": offset})
-        data = http_get_json(page_url)
-        if not isinstance(data, list) or not data:
-            break
-        out.extend(data)
-        if len(data) < limit:
+        n, rows = fetch_page(offset)
+        yield from rows
+        if n < limit:
             break
         offset += limit
-        sleep_polite()
-    return out
 
-def fetch_xtz_transactions(address: str) -> List[Dict[str, Any]]:
+def project_xtz_op(op: Dict[str, Any]) -> Optional[XtzOp]:
+    ts = op.get("timestamp")
+    if not ts:
+        return None
+    return XtzOp(
+        timestamp=ts,
+        level=int(op.get("level", 0)),
+        op_hash=str(op.get("hash", "")),
+        sender=(op.get("sender") or {}).get("address", "") or "",
+        target=(op.get("target") or {}).get("address", "") or "",
+        amount_mutez=safe_float(op.get("amount", 0)),
+        fee_mutez=safe_float(op.get("fee", 0)),
+        has_parameter=bool(op.get("parameter")),
+    )
+
+def project_token_transfer(tr: Dict[str, Any]) -> Optional[TokenTransferOp]:
+    ts = tr.get("timestamp")
+    if not ts:
+        return None
+    token = tr.get("token") or {}
+    metadata = token.get("metadata") or {}
+    return TokenTransferOp(
+        timestamp=ts,
+        level=int(tr.get("level", 0)),
+        op_hash=str(tr.get("transactionHash", "")),
+        from_address=(tr.get("from") or {}).get("address", "") or "",
+        to_address=(tr.get("to") or {}).get("address", "") or "",
+        contract=(token.get("contract") or {}).get("address", "") or "",
+        token_id=token.get("tokenId"),
+        standard=token.get("standard", ""),
+        symbol=metadata.get("symbol"),
+        name=metadata.get("name"),
+        decimals=metadata.get("decimals"),
+        raw_amount=safe_float(tr.get("amount", 0)),
+    )
+
+def fetch_xtz_transactions(address: str) -> Iterator[XtzOp]:
     # Includes simple transfers and contract calls that move tez (amount>0).
     # We'll pull both sender/target involvement.
     params = {
@@ -186,10 +519,9 @@ def fetch_xtz_transactions(address: str) -> List[Dict[str, Any]]:
         "timestamp.lt": END_ISO,
         "sort.asc": "timestamp",
     }
-    url = f"{TZKT_BASE}/operations/transactions?{urllib.parse.urlencode(params)}"
-    return tzkt_paginated(url)
+    return tzkt_paginated("/operations/transactions", params, project_xtz_op)
 
-def fetch_token_transfers(address: str) -> List[Dict[str, Any]]:
+def fetch_token_transfers(address: str) -> Iterator[TokenTransferOp]:
     # Token transfers (FA2/FA1.2) involving address
     params = {
         "anyof.from.to": address,
@@ -197,36 +529,32 @@ def fetch_token_transfers(address: str) -> List[Dict[str, Any]]:
         "timestamp.lt": END_ISO,
         "sort.asc": "timestamp",
     }
-    url = f"{TZKT_BASE}/tokens/transfers?{urllib.parse.urlencode(params)}"
-    return tzkt_paginated(url)
+    return tzkt_paginated("/tokens/transfers", params, project_token_transfer)
 
 
 # -----------------------------
 # Event building + heuristics
 # -----------------------------
 
-def build_events(address: str, xtz_ops: List[Dict[str, Any]], tok_ops: List[Dict[str, Any]]) -> List[Event]:
-    addr = address.lower()
+def build_events(address: str, xtz_ops: Iterable[XtzOp], tok_ops: Iterable[TokenTransferOp]) -> List[Event]:
+    # Tezos addresses are case-sensitive base58 and TzKT returns them verbatim,
+    # so compare as-is (no per-op lowercasing)
+    addr = address
     events: List[Event] = []
 
     # XTZ ops
     for op in xtz_ops:
-        ts = op.get("timestamp")
-        if not ts:
-            continue
-        sender = (op.get("sender") or {}).get("address", "") or ""
-        target = (op.get("target") or {}).get("address", "") or ""
-        amount_mutez = safe_float(op.get("amount", 0))
-        amount_xtz = amount_mutez / 1_000_000.0
-        fee_mutez = safe_float(op.get("fee", 0))
-        fee_xtz = fee_mutez / 1_000_000.0
+        ts = op.timestamp
+        sender, target = op.sender, op.target
+        amount_xtz = op.amount_mutez / 1_000_000.0
+        fee_xtz = op.fee_mutez / 1_000_000.0
 
         if amount_xtz == 0 and fee_xtz == 0:
             continue
 
-        direction = "in" if (target.lower() == addr and sender.lower() != addr) else "out"
+        direction = "in" if (target == addr and sender != addr) else "out"
         counterparty = sender if direction == "in" else target
-        note = op.get("parameter") and "contract_call" or "transfer"
+        note = "contract_call" if op.has_parameter else "transfer"
         tags = []
         conf = "medium"
 
@@ -237,14 +565,14 @@ def build_events(address: str, xtz_ops: List[Dict[str, Any]], tok_ops: List[Dict
             tags.append("payment_or_disposal")
 
         # mark self-transfer
-        if sender.lower() == addr and target.lower() == addr:
+        if sender == addr and target == addr:
             tags.append("self_transfer")
             conf = "high"
 
         events.append(Event(
             timestamp=ts,
-            level=int(op.get("level", 0)),
-            op_hash=str(op.get("hash", "")),
+            level=op.level,
+            op_hash=op.op_hash,
             kind="xtz_transfer",
             direction=direction,
             counterparty=counterparty,
@@ -253,28 +581,22 @@ def build_events(address: str, xtz_ops: List[Dict[str, Any]], tok_ops: List[Dict
             fee_xtz=clamp(fee_xtz),
             note=note,
             tags="|".join(tags),
-            confidence=conf
+            confidence=conf,
+            dt=iso_to_dt(ts),
+            day=ts[:10],          # TzKT timestamps are ISO-8601 UTC ("...Z")
         ))
 
     # Token transfers
     for tr in tok_ops:
-        ts = tr.get("timestamp")
-        if not ts:
-            continue
-        from_a = (tr.get("from") or {}).get("address", "") or ""
-        to_a = (tr.get("to") or {}).get("address", "") or ""
-        direction = "in" if to_a.lower() == addr else "out"
+        ts = tr.timestamp
+        from_a, to_a = tr.from_address, tr.to_address
+        direction = "in" if to_a == addr else "out"
         counterparty = from_a if direction == "in" else to_a
 
-        token = tr.get("token") or {}
-        contract = (token.get("contract") or {}).get("address", "") or ""
-        token_id = token.get("tokenId")
-        standard = token.get("standard", "")
-        symbol = (token.get("metadata") or {}).get("symbol")
-        name = (token.get("metadata") or {}).get("name")
-        decimals = token.get("metadata", {}).get("decimals")
+        contract, token_id, standard = tr.contract, tr.token_id, tr.standard
+        symbol, name, decimals = tr.symbol, tr.name, tr.decimals
 
-        raw_amount = safe_float(tr.get("amount", 0))
+        raw_amount = tr.raw_amount
         qty = raw_amount
         if decimals is not None:
             try:
@@ -293,8 +615,8 @@ def build_events(address: str, xtz_ops: List[Dict[str, Any]], tok_ops: List[Dict
 
         events.append(Event(
             timestamp=ts,
-            level=int(tr.get("level", 0)),
-            op_hash=str(tr.get("transactionHash", "")),
+            level=tr.level,
+            op_hash=tr.op_hash,
             kind="token_transfer",
             direction=direction,
             counterparty=counterparty,
@@ -303,7 +625,9 @@ def build_events(address: str, xtz_ops: List[Dict[str, Any]], tok_ops: List[Dict
             fee_xtz=0.0,          # token transfer endpoint doesn't include fee; we'll keep 0
             note="token_transfer",
             tags="|".join(tags),
-            confidence=conf
+            confidence=conf,
+            dt=iso_to_dt(ts),
+            day=ts[:10],
         ))
 
     # sort
@@ -311,91 +635,101 @@ def build_events(address: str, xtz_ops: List[Dict[str, Any]], tok_ops: List[Dict
     return events
 
 
+# -----------------------------
+# Matching kernels
+# -----------------------------
+
+def fifo_consume(lot_qty: List[float], lot_basis: List[float], head: int, qty: float) -> Tuple[float, int, List[Tuple[int, float]]]:
+    """
+    Consume qty from FIFO lots starting at index head (lot_qty is updated in place).
+    Returns (basis, new_head, takes) where takes are (lot index, qty taken).
+    """
+    basis = 0.0
+    takes: List[Tuple[int, float]] = []
+    i, n = head, len(lot_qty)
+    while qty > 1e-12 and i < n:
+        take = min(qty, lot_qty[i])
+        basis += take * lot_basis[i]
+        takes.append((i, take))
+        lot_qty[i] -= take
+        qty -= take
+        if lot_qty[i] <= 1e-12:
+            i += 1
+    return basis, i, takes
+
+def hmrc_match_same_day(lst: Deque[Acq], qty: float) -> Tuple[float, List[Dict[str, Any]]]:
+    """Consume qty from one day's acquisition records, oldest first."""
+    cost = 0.0
+    used = []
+    # drop records already drained by 30-day matching
+    while lst and lst[0].qty <= 1e-12:
+        lst.popleft()
+    while qty > 1e-12 and lst:
+        rec = lst[0]
+        take = min(qty, rec.qty)
+        cost += take * rec.cost_per
+        used.append({"from_acq_ts": rec.ts, "take_qty": take, "cost_per_gbp": rec.cost_per})
+        rec.qty -= take
+        qty -= take
+        if rec.qty <= 1e-12:
+            lst.popleft()
+    return cost, used
+
+def hmrc_30_day_window_end(dt: datetime) -> datetime:
+    # The 30-day rule covers the 30 calendar days after the day of disposal,
+    # i.e. up to (not including) midnight UTC starting day D+31.
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=31)
+
+def hmrc_match_30_day(acqs: List[Acq], acq_dts: List[datetime], start: int, dt: datetime, qty: float) -> Tuple[float, float, List[Dict[str, Any]]]:
+    """
+    Consume qty from acquisitions after dt up to the end of the 30th day after
+    the disposal day. acqs/acq_dts are time-sorted and start is the first index
+    after dt. Returns (cost, qty still unmatched, used).
+    """
+    cost = 0.0
+    used = []
+    window_end = hmrc_30_day_window_end(dt)
+    i, n = start, len(acqs)
+    while qty > 1e-12 and i < n and acq_dts[i] < window_end:
+        rec = acqs[i]
+        i += 1
+        if rec.qty <= 1e-12:
+            continue
+        take = min(qty, rec.qty)
+        cost += take * rec.cost_per
+        used.append({"from_acq_ts": rec.ts, "take_qty": take, "cost_per_gbp": rec.cost_per, "rule": "30-day"})
+        rec.qty -= take
+        qty -= take
+    return cost, qty, used
+
+
 # -----------------------------
 # Tax classification
 # -----------------------------
 
-def classify_irs(events: List[Event], usd_oracle: PriceOracle) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+def classify_irs(events: List[Event], fmv_usd: List[float]) -> Iterator[Tuple[Any, ...]]:
     """
     IRS approach:
     - Buying/receiving isn't always taxable; selling/exchanging/using is.
-    - FIFO if not specifically identifying units.
-    We'll compute:
-      - ledger rows with 'irs_category'
-      - disposal rows with FIFO lots for XTZ only (best-effort).
+    - FIFO if not specifically identifying units (see irs_fifo_disposals).
+    fmv_usd[i] is the daily XTZ/USD price for events[i] (0.0 for tokens).
+    Yields one ledger row (in IRS_FIELDS order) with 'irs_category' per event.
     """
-    ledger: List[Dict[str, Any]] = []
-    disposals: List[Dict[str, Any]] = []
-
-    # FIFO lots for XTZ (acquisitions create lots; disposals consume lots)
-    xtz_lots: List[Dict[str, Any]] = []  # {acquired_dt, qty, basis_usd_per_xtz}
-
-    for e in events:
-        dt = iso_to_dt(e.timestamp)
-        fmv_usd = usd_oracle.xtz_fmv(dt) if e.asset == "XTZ" else 0.0
+    for e, fmv in zip(events, fmv_usd):
 
         irs_category = "review"
         taxable = "unknown"
-        proceeds_usd = ""
-        basis_usd = ""
-        gain_usd = ""
 
         if e.asset == "XTZ":
             if e.direction == "in" and e.quantity > 0:
                 # Could be income (staking payout/airdrop/etc) or just transfer from self/other wallet
                 irs_category = "acquisition_or_income_review"
                 taxable = "maybe"
-                # For FIFO capital gains later, we treat as an acquisition lot with basis = FMV at receipt (best-effort).
-                xtz_lots.append({
-                    "acquired_ts": e.timestamp,
-                    "qty": e.quantity,
-                    "basis_per": fmv_usd
-                })
-
             elif e.direction == "out" and e.quantity > 0:
                 # Disposal event: spend/sell/swap -> capital gain/loss generally
                 irs_category = "disposal_capital"
                 taxable = "yes"
 
-                qty_to_dispose = e.quantity
-                proceeds = qty_to_dispose * fmv_usd  # best-effort proceeds using same-day FMV (you may replace with actual sale proceeds)
-                basis = 0.0
-
-                lot_details = []
-                while qty_to_dispose > 1e-12 and xtz_lots:
-                    lot = xtz_lots[0]
-                    take = min(qty_to_dispose, lot["qty"])
-                    basis += take * lot["basis_per"]
-                    lot_details.append({
-                        "from_lot_acquired_ts": lot["acquired_ts"],
-                        "take_qty": take,
-                        "basis_per_usd": lot["basis_per"]
-                    })
-                    lot["qty"] -= take
-                    qty_to_dispose -= take
-                    if lot["qty"] <= 1e-12:
-                        xtz_lots.pop(0)
-
-                g = proceeds - basis
-
-                proceeds_usd = round(proceeds, 8)
-                basis_usd = round(basis, 8)
-                gain_usd = round(g, 8)
-
-                disposals.append({
-                    "timestamp": e.timestamp,
-                    "asset": e.asset,
-                    "qty_disposed": e.quantity,
-                    "fmv_usd_per_xtz_used": round(fmv_usd, 8),
-                    "proceeds_usd_est": proceeds_usd,
-                    "basis_usd_fifo_est": basis_usd,
-                    "gain_usd_est": gain_usd,
-                    "fee_xtz": e.fee_xtz,
-                    "op_hash": e.op_hash,
-                    "lot_breakdown_json": json.dumps(lot_details, ensure_ascii=False),
-                    "note": "FIFO used if you did not specifically identify units (IRS FAQ)."
-                })
-
         else:
             # Token/NFT: we can tag but not compute basis without a pricing feed per token.
             if e.direction == "out":
@@ -405,164 +739,181 @@ def classify_irs(events: List[Event], usd_oracle: PriceOracle) -> Tuple[List[Dic
                 irs_category = "token_acquisition_or_income_review"
                 taxable = "maybe"
 
-        ledger.append({
-            "timestamp": e.timestamp,
-            "level": e.level,
-            "op_hash": e.op_hash,
-            "kind": e.kind,
-            "direction": e.direction,
-            "counterparty": e.counterparty,
-            "asset": e.asset,
-            "quantity": e.quantity,
-            "fee_xtz": e.fee_xtz,
-            "tags": e.tags,
-            "confidence": e.confidence,
-            "irs_category": irs_category,
-            "irs_taxable": taxable,
-            "xtz_fmv_usd_daily": round(fmv_usd, 8) if e.asset == "XTZ" else ""
-        })
-
-    return ledger, disposals
-
-
-def hmrc_pooling_disposals(events: List[Event], gbp_oracle: PriceOracle) -> List[Dict[str, Any]]:
+        yield (
+            e.timestamp,
+            e.level,
+            e.op_hash,
+            e.kind,
+            e.direction,
+            e.counterparty,
+            e.asset,
+            e.quantity,
+            e.fee_xtz,
+            e.tags,
+            e.confidence,
+            irs_category,
+            taxable,
+            round(fmv, 8) if e.asset == "XTZ" else "",  # xtz_fmv_usd_daily
+        )
+
+
+def irs_fifo_disposals(events: List[Event], fmv_usd: List[float]) -> Iterator[Tuple[Any, ...]]:
+    """
+    IRS FIFO disposals for XTZ only (best-effort): incoming XTZ creates a lot with
+    basis = FMV at receipt, outgoing XTZ consumes the oldest lots first.
+    Yields one disposal row (in FIFO_FIELDS order) per outgoing XTZ event.
+    """
+    # FIFO lots for XTZ (acquisitions create lots; disposals consume lots), kept
+    # as parallel arrays; lots before lot_head are fully consumed
+    lot_ts: List[str] = []
+    lot_qty: List[float] = []
+    lot_basis: List[float] = []  # USD per XTZ
+    lot_head = 0
+
+    for e, fmv in zip(events, fmv_usd):
+        if e.asset != "XTZ" or e.quantity <= 0:
+            continue
+
+        if e.direction == "in":
+            # For FIFO capital gains, we treat as an acquisition lot with basis = FMV at receipt (best-effort).
+            lot_ts.append(e.timestamp)
+            lot_qty.append(e.quantity)
+            lot_basis.append(fmv)
+            continue
+
+        qty_to_dispose = e.quantity
+        proceeds = qty_to_dispose * fmv  # best-effort proceeds using same-day FMV (you may replace with actual sale proceeds)
+
+        basis, lot_head, takes = fifo_consume(lot_qty, lot_basis, lot_head, qty_to_dispose)
+        lot_details = [{
+            "from_lot_acquired_ts": lot_ts[i],
+            "take_qty": take,
+            "basis_per_usd": lot_basis[i]
+        } for i, take in takes]
+
+        yield (
+            e.timestamp,
+            e.asset,
+            e.quantity,
+            round(fmv, 8),
+            round(proceeds, 8),
+            round(basis, 8),
+            round(proceeds - basis, 8),
+            e.fee_xtz,
+            e.op_hash,
+            dumps_json(lot_details),  # pre-serialized; csv quotes it once
+            "FIFO used if you did not specifically identify units (IRS FAQ).",
+        )
+
+
+def hmrc_pooling_disposals(events: List[Event], fmv_gbp: List[float]) -> Iterator[Tuple[Any, ...]]:
     """
     HMRC-style matching for XTZ only (best-effort):
     same-day acquisitions, then 30-day acquisitions, then Section 104 pool average.
-    This produces estimated gains in GBP.
+    Yields one disposal row (in HMRC_FIELDS order) with estimated gains in GBP
+    per outgoing XTZ event. events must be time-sorted (as build_events returns them);
+    fmv_gbp[i] is the daily XTZ/GBP price for events[i].
 
     NOTE: Full HMRC matching is per-asset. For tokens/NFTs you need GBP pricing per asset.
     """
     # We'll build day buckets of acquisitions for XTZ
-    acq_by_day: Dict[str, List[Dict[str, Any]]] = {}
-    disposals: List[Dict[str, Any]] = []
+    acq_by_day: Dict[str, Deque[Acq]] = {}
 
     # Section 104 pool
     pool_qty = 0.0
     pool_cost_gbp = 0.0
 
-    # store acquisitions for 30-day matching: list of (dt, qty, cost_per_unit)
-    future_acqs: List[Tuple[datetime, float, float, str]] = []  # dt, qty, cost_per, ts
-
-    xtz_events = [e for e in events if e.asset == "XTZ" and e.quantity > 0]
-    xtz_events.sort(key=lambda e: e.timestamp)
-
-    # First pass: record acquisitions per day
-    for e in xtz_events:
-        dt = iso_to_dt(e.timestamp)
-        day = dt.strftime("%Y-%m-%d")
-        fmv_gbp = gbp_oracle.xtz_fmv(dt)
-        if e.direction == "in":
-            acq_by_day.setdefault(day, []).append({
-                "ts": e.timestamp,
-                "dt": dt,
-                "qty": e.quantity,
-                "cost_per": fmv_gbp
-            })
-            future_acqs.append((dt, e.quantity, fmv_gbp, e.timestamp))
-
-    # helper: consume from an acquisition record list
-    def consume_from_list(lst: List[Dict[str, Any]], qty_needed: float) -> Tuple[float, List[Dict[str, Any]]]:
-        cost = 0.0
-        used = []
-        i = 0
-        while qty_needed > 1e-12 and i < len(lst):
-            rec = lst[i]
-            take = min(qty_needed, rec["qty"])
-            cost += take * rec["cost_per"]
-            used.append({"from_acq_ts": rec["ts"], "take_qty": take, "cost_per_gbp": rec["cost_per"]})
-            rec["qty"] -= take
-            qty_needed -= take
-            if rec["qty"] <= 1e-12:
-                i += 1
-            else:
-                break
-        # drop fully consumed
-        lst[:] = [r for r in lst if r["qty"] > 1e-12]
-        return cost, used
-
-    # Second pass: process chronological; update pool as we go
-    # Pool increases with acquisitions unless they later get matched by same-day/30-day when disposing.
-    # This is a simplified approach: we add to pool immediately, then when disposing we preferentially match.
-    for e in xtz_events:
-        dt = iso_to_dt(e.timestamp)
-        day = dt.strftime("%Y-%m-%d")
-        fmv_gbp = gbp_oracle.xtz_fmv(dt)
-
-        if e.direction == "in":
-            # add to pool
-            pool_qty += e.quantity
-            pool_cost_gbp += e.quantity * fmv_gbp
+    # acquisitions for 30-day matching, in time order. These are the same Acq
+    # objects held in acq_by_day, so consuming one updates both views.
+    future_acqs: List[Acq] = []
+    future_dts: List[datetime] = []  # parallel to future_acqs, for bisect
+    head = 0  # everything before this index is at/before the current disposal
+
+    # Single pass over the (time-sorted) events. Acquisitions are registered for
+    # matching as soon as they are seen, but every event is processed in order
+    # through `pending`; a disposal at the front waits there until its 30-day
+    # window has closed, so all acquisitions it may match are already known.
+    pending: Deque[Tuple[Event, float]] = deque()  # (event, fmv_gbp)
+
+    def settle(now: Optional[datetime]) -> Iterator[Tuple[Any, ...]]:
+        # process pending events in order; now=None flushes everything
+        nonlocal pool_qty, pool_cost_gbp, head
+        while pending:
+            e, fmv_gbp = pending[0]
+            dt, day = e.dt, e.day
+            if e.direction != "in" and now is not None and now < hmrc_30_day_window_end(dt):
+                break  # an acquisition at `now` could still match this disposal
+            pending.popleft()
+
+            if e.direction == "in":
+                # Pool increases with acquisitions unless they later get matched by same-day/30-day when disposing.
+                # This is a simplified approach: we add to pool immediately, then when disposing we preferentially match.
+                pool_qty += e.quantity
+                pool_cost_gbp += e.quantity * fmv_gbp
+                continue
+
+            # disposal
+            qty = e.quantity
+            proceeds = qty * fmv_gbp
+
+            # 1) same-day matching
+            same_day_list = acq_by_day.get(day, deque())
+            same_day_cost, same_day_used = hmrc_match_same_day(same_day_list, qty)
+            qty_left = qty - sum(u["take_qty"] for u in same_day_used)
+            cost_total = same_day_cost
+            match_used = same_day_used[:]
+
+            # 2) 30-day matching (acquisitions AFTER disposal within 30 days)
+            # disposals are chronological, so acquisitions at/before dt are never
+            # eligible again; advance head past them
+            head = bisect_right(future_dts, dt, lo=head)
+            if qty_left > 1e-12:
+                thirty_cost, qty_left, thirty_used = hmrc_match_30_day(future_acqs, future_dts, head, dt, qty_left)
+                cost_total += thirty_cost
+                match_used.extend(thirty_used)
+
+            # 3) Section 104 pool for remainder
+            pool_used = []
+            if qty_left > 1e-12:
+                if pool_qty <= 1e-12:
+                    # nothing in pool; treat cost as 0 and flag
+                    pool_cost = 0.0
+                else:
+                    avg_cost = pool_cost_gbp / pool_qty
+                    pool_cost = qty_left * avg_cost
+                    pool_used.append({"take_qty": qty_left, "avg_cost_per_gbp": avg_cost, "rule": "S104"})
+                    # reduce pool
+                    pool_qty -= qty_left
+                    pool_cost_gbp -= pool_cost
+                cost_total += pool_cost
+                qty_left = 0.0
+
+            gain = proceeds - cost_total
+
+            yield (
+                e.timestamp,
+                "XTZ",
+                qty,
+                round(fmv_gbp, 8),
+                round(proceeds, 8),
+                round(cost_total, 8),
+                round(gain, 8),
+                e.op_hash,
+                dumps_json(match_used + pool_used),  # pre-serialized; csv quotes it once
+                "Best-effort same-day, 30-day, then Section 104 style matching (HMRC Cryptoassets Manual).",
+            )
+
+    for e, fmv in zip(events, fmv_gbp):
+        if e.asset != "XTZ" or e.quantity <= 0:
             continue
-
-        # disposal
-        qty = e.quantity
-        proceeds = qty * fmv_gbp
-
-        # 1) same-day matching
-        same_day_list = acq_by_day.get(day, [])
-        same_day_cost, same_day_used = consume_from_list(same_day_list, qty)
-        qty_left = qty - sum(u["take_qty"] for u in same_day_used)
-        cost_total = same_day_cost
-        match_used = same_day_used[:]
-
-        # 2) 30-day matching (acquisitions AFTER disposal within 30 days)
-        if qty_left > 1e-12:
-            end_dt = dt.replace(tzinfo=timezone.utc)  # already tz-aware
-            # find eligible acquisitions in (dt, dt+30d]
-            thirty = []
-            for (adt, aqty, cost_per, ts) in list(future_acqs):
-                if adt > dt and (adt - dt).days <= 30 and aqty > 1e-12:
-                    thirty.append([adt, aqty, cost_per, ts])
-            thirty.sort(key=lambda x: x[0])
-
-            for rec in thirty:
-                if qty_left <= 1e-12:
-                    break
-                take = min(qty_left, rec[1])
-                cost_total += take * rec[2]
-                match_used.append({"from_acq_ts": rec[3], "take_qty": take, "cost_per_gbp": rec[2], "rule": "30-day"})
-                rec[1] -= take
-                qty_left -= take
-
-                # write back to future_acqs
-                for idx, (adt, aqty, cper, ts2) in enumerate(future_acqs):
-                    if ts2 == rec[3]:
-                        future_acqs[idx] = (adt, aqty - take, cper, ts2)
-                        break
-
-        # 3) Section 104 pool for remainder
-        pool_used = []
-        if qty_left > 1e-12:
-            if pool_qty <= 1e-12:
-                # nothing in pool; treat cost as 0 and flag
-                pool_cost = 0.0
-            else:
-                avg_cost = pool_cost_gbp / pool_qty
-                pool_cost = qty_left * avg_cost
-                pool_used.append({"take_qty": qty_left, "avg_cost_per_gbp": avg_cost, "rule": "S104"})
-                # reduce pool
-                pool_qty -= qty_left
-                pool_cost_gbp -= pool_cost
-            cost_total += pool_cost
-            qty_left = 0.0
-
-        gain = proceeds - cost_total
-
-        disposals.append({
-            "timestamp": e.timestamp,
-            "asset": "XTZ",
-            "qty_disposed": qty,
-            "fmv_gbp_per_xtz_used": round(fmv_gbp, 8),
-            "proceeds_gbp_est": round(proceeds, 8),
-            "allowable_cost_gbp_est": round(cost_total, 8),
-            "gain_gbp_est": round(gain, 8),
-            "op_hash": e.op_hash,
-            "matching_breakdown_json": json.dumps(match_used + pool_used, ensure_ascii=False),
-            "note": "Best-effort same-day, 30-day, then Section 104 style matching (HMRC Cryptoassets Manual)."
-        })
-
-    return disposals
+        yield from settle(e.dt)
+        if e.direction == "in":
+            rec = Acq(ts=e.timestamp, dt=e.dt, qty=e.quantity, cost_per=fmv)
+            acq_by_day.setdefault(e.day, deque()).append(rec)
+            future_acqs.append(rec)
+            future_dts.append(e.dt)
+        pending.append((e, fmv))
+    yield from settle(None)
 
 
 # -----------------------------
@@ -580,61 +931,51 @@ def main():
 
     ensure_out_dir()
 
-    print(f"[+] Fetching 2025 ops for {address} from TzKT...")
-    xtz_ops = fetch_xtz_transactions(address)
-    tok_ops = fetch_token_transfers(address)
-    print(f"    XTZ ops: {len(xtz_ops)}")
-    print(f"    Token transfers: {len(tok_ops)}")
-
-    print("[+] Building unified event ledger...")
-    events = build_events(address, xtz_ops, tok_ops)
-
-    # pricing oracles (daily)
-    usd_oracle = PriceOracle("usd")
-    gbp_oracle = PriceOracle("gbp")
+    # Ops are streamed from TzKT straight into build_events.
+    print(f"[+] Fetching 2025 ops for {address} from TzKT and building unified event ledger...")
+    events = build_events(address, fetch_xtz_transactions(address), fetch_token_transfers(address))
+    print(f"    XTZ events: {sum(1 for e in events if e.kind == 'xtz_transfer')}")
+    print(f"    Token transfers: {sum(1 for e in events if e.kind == 'token_transfer')}")
 
+    # Daily XTZ price per event, looked up once and shared by all classifiers
+    # (0.0 for token events).
     if no_prices:
-        # stub: returns 0 so you can still get event classification
-        usd_oracle.xtz_fmv = lambda dt: 0.0  # type: ignore
-        gbp_oracle.xtz_fmv = lambda dt: 0.0  # type: ignore
-
-    print("[+] Classifying IRS ledger and FIFO disposals (XTZ only)...")
-    irs_ledger, irs_disposals = classify_irs(events, usd_oracle)
+        # zeros so you can still get event classification
+        fmv_usd = [0.0] * len(events)
+        fmv_gbp = [0.0] * len(events)
+    else:
+        print("[+] Pricing XTZ events from CoinGecko (daily)...")
+        usd_oracle = PriceOracle("usd")
+        gbp_oracle = PriceOracle("gbp")
+        start_dt, end_dt = iso_to_dt(START_ISO), iso_to_dt(END_ISO)
+        usd_oracle.prefetch_range(start_dt, end_dt)
+        gbp_oracle.prefetch_range(start_dt, end_dt)
+        fmv_usd = [usd_oracle.price_for_day(e.day) if e.asset == "XTZ" else 0.0 for e in events]
+        fmv_gbp = [gbp_oracle.price_for_day(e.day) if e.asset == "XTZ" else 0.0 for e in events]
+
+    # Classifiers are generators; rows are computed as they are written.
+    print("[+] Writing IRS ledger...")
+    write_csv(os.path.join(OUT_DIR, "irs_2025_events.csv"), IRS_FIELDS, classify_irs(events, fmv_usd))
+
+    print("[+] Computing IRS FIFO disposals (XTZ only)...")
+    irs_disposal_count = write_csv(os.path.join(OUT_DIR, "irs_2025_disposals_fifo.csv"), FIFO_FIELDS, irs_fifo_disposals(events, fmv_usd))
 
     print("[+] Computing HMRC disposals with pooling (XTZ only)...")
-    hmrc_disposals = hmrc_pooling_disposals(events, gbp_oracle)
-
-    # Write outputs
-    print("[+] Writing outputs...")
-    irs_fields = list(irs_ledger[0].keys()) if irs_ledger else [
-        "timestamp","level","op_hash","kind","direction","counterparty","asset","quantity","fee_xtz","tags","confidence","irs_category","irs_taxable","xtz_fmv_usd_daily"
-    ]
-    write_csv(os.path.join(OUT_DIR, "irs_2025_events.csv"), irs_ledger, irs_fields)
-
-    fifo_fields = list(irs_disposals[0].keys()) if irs_disposals else [
-        "timestamp","asset","qty_disposed","fmv_usd_per_xtz_used","proceeds_usd_est","basis_usd_fifo_est","gain_usd_est","fee_xtz","op_hash","lot_breakdown_json","note"
-    ]
-    write_csv(os.path.join(OUT_DIR, "irs_2025_disposals_fifo.csv"), irs_disposals, fifo_fields)
-
-    hmrc_fields = list(hmrc_disposals[0].keys()) if hmrc_disposals else [
-        "timestamp","asset","qty_disposed","fmv_gbp_per_xtz_used","proceeds_gbp_est","allowable_cost_gbp_est","gain_gbp_est","op_hash","matching_breakdown_json","note"
-    ]
-    write_csv(os.path.join(OUT_DIR, "hmrc_2025_disposals_pooling.csv"), hmrc_disposals, hmrc_fields)
+    hmrc_disposal_count = write_csv(os.path.join(OUT_DIR, "hmrc_2025_disposals_pooling.csv"), HMRC_FIELDS, hmrc_pooling_disposals(events, fmv_gbp))
 
     summary = {
         "address": address,
         "year": YEAR,
         "event_count": len(events),
-        "irs_disposal_count_xtz": len(irs_disposals),
-        "hmrc_disposal_count_xtz": len(hmrc_disposals),
+        "irs_disposal_count_xtz": irs_disposal_count,
+        "hmrc_disposal_count_xtz": hmrc_disposal_count,
         "notes": [
             "Token/NFT gain calculations require per-token GBP/USD pricing; this script flags likely disposals but does not price them.",
             "Tezos delegation payouts often look like ordinary incoming transfers; review 'acquisition_or_income_review' rows.",
             "Prices are daily CoinGecko snapshots (not exact timestamp). Replace oracle if you need minute-level FMV."
         ]
     }
-    with open(os.path.join(OUT_DIR, "summary_2025.json"), "w", encoding="utf-8") as f:
-        json.dump(summary, f, indent=2)
+    write_json(os.path.join(OUT_DIR, "summary_2025.json"), summary)
 
     print("[✓] Done.")
     print(f"Outputs in ./{OUT_DIR}/")